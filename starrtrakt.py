@@ -1,15 +1,33 @@
 #!/usr/bin/env python3
 
+import atexit
+import base64
+import http.client
 import json
 import logging
 import logging.handlers
 import os
+import pathlib
+import queue
 import sys
 import time
 import traceback
-import urllib.error
+import urllib.parse
 import urllib.request
 
+try:
+    import orjson
+
+    def json_dumps(data, pretty=False):
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if pretty else 0)
+
+    json_loads = orjson.loads
+except ImportError:
+    def json_dumps(data, pretty=False):
+        return json.dumps(data, indent=2 if pretty else None).encode("utf-8")
+
+    json_loads = json.loads
+
 # --- Trakt credentials from environment variables ---
 TRAKT_CLIENT_ID = os.environ.get("TRAKT_CLIENT_ID")
 TRAKT_CLIENT_SECRET = os.environ.get("TRAKT_CLIENT_SECRET")
@@ -20,24 +38,34 @@ if not TRAKT_CLIENT_ID or not TRAKT_CLIENT_SECRET:
     sys.exit(1)
 
 # --- Logging setup ---
-script_dir = os.path.dirname(os.path.abspath(__file__))
-logs_dir = os.path.join(script_dir, "logs")
-tmp_dir = os.path.join(script_dir, "tmp")
-os.makedirs(logs_dir, exist_ok=True)
-os.makedirs(tmp_dir, exist_ok=True)
+script_dir = pathlib.Path(__file__).resolve().parent
+logs_dir = script_dir / "logs"
+tmp_dir = script_dir / "tmp"
+logs_dir.mkdir(exist_ok=True)
+tmp_dir.mkdir(exist_ok=True)
+log_file = logs_dir / "starrtrakt.log"
+token_file = tmp_dir / "trakt_tokens.json"
 
 def setup_logging():
-    log_path = os.path.join(logs_dir, "starrtrakt.log")
     try:
         file_handler = logging.handlers.RotatingFileHandler(
-            log_path, maxBytes=2 * 1024 * 1024, backupCount=5
+            log_file, maxBytes=2 * 1024 * 1024, backupCount=5
         )
         file_handler.setLevel(logging.INFO)
         file_handler.setFormatter(logging.Formatter('%(asctime)s %(name)s %(levelname)s %(message)s'))
 
+        # Records are only queued by the caller; file writes happen on the listener thread
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.setFormatter(logging.Formatter('%(message)s'))
+
         logging.basicConfig(
             level=logging.INFO,
-            handlers=[file_handler]
+            handlers=[queue_handler]
         )
     except Exception as e:
         print(f"WARNING: Could not initialize file logging: {e}", flush=True)
@@ -51,75 +79,152 @@ def setup_logging():
 logger = setup_logging()
 
 # --- HTTP/API Helpers ---
-def http_post(url, data, headers=None, timeout=10):
-    req = urllib.request.Request(
-        url,
-        data=json.dumps(data).encode("utf-8"),
-        headers=headers or {},
-        method="POST"
+# Keep-alive HTTPS connections, one per host, reused for the lifetime of the process
+_connections = {}
+
+def _new_connection(host, timeout):
+    # Honour HTTPS_PROXY/NO_PROXY the same way urllib.request does, tunnelling through the proxy
+    proxy = urllib.request.getproxies().get("https")
+    if not proxy or urllib.request.proxy_bypass(host):
+        return http.client.HTTPSConnection(host, timeout=timeout)
+
+    if "://" not in proxy:
+        proxy = f"http://{proxy}"
+    proxy_parts = urllib.parse.urlsplit(proxy)
+    conn = http.client.HTTPSConnection(
+        proxy_parts.hostname,
+        proxy_parts.port or (443 if proxy_parts.scheme == "https" else 80),
+        timeout=timeout
     )
-    try:
-        with urllib.request.urlopen(req, timeout=timeout) as resp:
-            return resp.read().decode("utf-8"), resp.status
-    except urllib.error.HTTPError as e:
-        return e.read().decode("utf-8"), e.code
-    except Exception as e:
-        raise
+    tunnel_headers = {}
+    if proxy_parts.username:
+        credentials = f"{urllib.parse.unquote(proxy_parts.username)}:{urllib.parse.unquote(proxy_parts.password or '')}"
+        tunnel_headers["Proxy-Authorization"] = "Basic " + base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+    conn.set_tunnel(host, headers=tunnel_headers)
+    return conn
+
+def _get_connection(host, timeout):
+    conn = _connections.get(host)
+    if conn is None:
+        conn = _connections[host] = _new_connection(host, timeout)
+    else:
+        conn.timeout = timeout
+        if conn.sock:
+            conn.sock.settimeout(timeout)
+    return conn
+
+def http_request(method, url, body=None, headers=None, timeout=10):
+    parts = urllib.parse.urlsplit(url)
+    path = parts.path or "/"
+    if parts.query:
+        path = f"{path}?{parts.query}"
+
+    for _ in range(2):
+        conn = _get_connection(parts.netloc, timeout)
+        reused = conn.sock is not None
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            resp = conn.getresponse()
+        except (ConnectionResetError, BrokenPipeError):
+            conn.close()
+            # Only a reused keep-alive connection that the server dropped before answering
+            # is safe to resend on; anything else may already have been processed
+            if reused:
+                continue
+            raise
+        except Exception:
+            conn.close()
+            raise
+
+        try:
+            return resp.read(), resp.status
+        except Exception:
+            conn.close()
+            raise
+
+def http_error_message(status, body):
+    return f"HTTP {status} {body.decode('utf-8', 'replace')}"
+
+def http_post(url, data, headers=None, timeout=10):
+    return http_request("POST", url, body=json_dumps(data), headers=headers, timeout=timeout)
 
 # --- Trakt Token Management ---
-def get_token_file_path():
-    return os.path.join(tmp_dir, "trakt_tokens.json")
+# Decoded tokens and the headers derived from them, kept for the lifetime of the process
+_token_cache = None
+_token_expiry = 0.0
+_token_mtime = None
+_headers_cache = None
+
+_TRAKT_STATIC_HEADERS = {
+    "Content-Type": "application/json",
+    "trakt-api-version": "2",
+    "trakt-api-key": TRAKT_CLIENT_ID
+}
+
+def _token_file_mtime():
+    try:
+        return token_file.stat().st_mtime_ns
+    except OSError:
+        return None
+
+def _cache_tokens(tokens):
+    global _token_cache, _token_expiry, _token_mtime
+    _token_cache = tokens
+    _token_expiry = trakt_token_expiry(tokens)
+    _token_mtime = _token_file_mtime()
 
 def trakt_load_tokens():
-    token_file = get_token_file_path()
-    if os.path.exists(token_file):
-        with open(token_file, "r") as f:
-            return json.load(f)
+    if token_file.exists():
+        with open(token_file, "rb") as f:
+            tokens = json_loads(f.read())
+        _cache_tokens(tokens)
+        return tokens
     return None
 
 def trakt_save_tokens(tokens):
-    token_file = get_token_file_path()
-    with open(token_file, "w") as f:
-        json.dump(tokens, f, indent=2)
+    with open(token_file, "wb") as f:
+        f.write(json_dumps(tokens, pretty=True))
+    _cache_tokens(tokens)
 
-def trakt_is_token_expired(tokens):
+def trakt_token_expiry(tokens):
     if not tokens or "created_at" not in tokens or "expires_in" not in tokens:
-        return True
-    return time.time() > (tokens["created_at"] + tokens["expires_in"] - 60)
+        return 0.0
+    return tokens["created_at"] + tokens["expires_in"] - 60
+
+def trakt_is_token_expired(tokens):
+    return time.time() > trakt_token_expiry(tokens)
 
 def trakt_post_json(url, data):
-    req = urllib.request.Request(
-        url,
-        data=json.dumps(data).encode("utf-8"),
-        headers={"Content-Type": "application/json"},
-        method="POST"
-    )
-    with urllib.request.urlopen(req, timeout=15) as resp:
-        return json.loads(resp.read().decode("utf-8"))
+    body, status = http_post(url, data, headers={"Content-Type": "application/json"}, timeout=15)
+    if status >= 400:
+        raise Exception(http_error_message(status, body))
+    return json_loads(body)
 
-def trakt_get_new_tokens_with_pin(pin):
+def trakt_request_tokens(grant_type, **grant):
     payload = {
-        "code": pin,
+        **grant,
         "client_id": TRAKT_CLIENT_ID,
         "client_secret": TRAKT_CLIENT_SECRET,
         "redirect_uri": TRAKT_REDIRECT_URI,
-        "grant_type": "authorization_code"
+        "grant_type": grant_type
     }
     return trakt_post_json("https://api.trakt.tv/oauth/token", payload)
 
+def trakt_get_new_tokens_with_pin(pin):
+    return trakt_request_tokens("authorization_code", code=pin)
+
 def trakt_refresh_tokens(tokens):
-    payload = {
-        "refresh_token": tokens["refresh_token"],
-        "client_id": TRAKT_CLIENT_ID,
-        "client_secret": TRAKT_CLIENT_SECRET,
-        "redirect_uri": TRAKT_REDIRECT_URI,
-        "grant_type": "refresh_token"
-    }
-    return trakt_post_json("https://api.trakt.tv/oauth/token", payload)
+    return trakt_request_tokens("refresh_token", refresh_token=tokens["refresh_token"])
 
-def trakt_get_valid_tokens():
-    tokens = trakt_load_tokens()
-    if tokens and not trakt_is_token_expired(tokens):
+def trakt_get_valid_tokens(force_refresh=False):
+    if not force_refresh and _token_cache is not None and time.time() < _token_expiry:
+        return _token_cache
+
+    # Only re-read the token file on a cold start or if another process has rewritten it
+    tokens = _token_cache
+    if tokens is None or _token_file_mtime() != _token_mtime:
+        tokens = trakt_load_tokens()
+    if tokens and not force_refresh and not trakt_is_token_expired(tokens):
         return tokens
     if tokens and "refresh_token" in tokens:
         try:
@@ -128,7 +233,7 @@ def trakt_get_valid_tokens():
             logger.info("Successfully refreshed Trakt access token.")
             return new_tokens
         except Exception as e:
-            logger.warning(f"Trakt token refresh failed: {e}, falling back to PIN.")
+            logger.warning("Trakt token refresh failed: %s, falling back to PIN.", e)
     
     print("To authorize this script with Trakt, visit:")
     print(f"https://trakt.tv/oauth/authorize?response_type=code&client_id={TRAKT_CLIENT_ID}&redirect_uri={TRAKT_REDIRECT_URI}")
@@ -141,67 +246,77 @@ def trakt_get_valid_tokens():
     return new_tokens
 
 def trakt_headers():
+    """Return the shared Trakt request headers; callers must copy before modifying."""
+    global _headers_cache
     tokens = trakt_get_valid_tokens()
-    return {
-        "Authorization": f"Bearer {tokens['access_token']}",
-        "Content-Type": "application/json",
-        "trakt-api-version": "2",
-        "trakt-api-key": TRAKT_CLIENT_ID
-    }
+    if _headers_cache is None or _headers_cache[0] is not tokens:
+        _headers_cache = (tokens, {
+            **_TRAKT_STATIC_HEADERS,
+            "Authorization": "Bearer " + tokens["access_token"]
+        })
+    return _headers_cache[1]
 
 # --- Trakt Watchlist Management ---
 class TraktWatchlistConnection:
     def __init__(self):
         self.trakt_base_url = "https://api.trakt.tv"
+        self._add_url = self.trakt_base_url + "/sync/watchlist"
+        self._remove_url = self.trakt_base_url + "/sync/watchlist/remove"
 
-    def _make_watchlist_request(self, action, media_type, item):
+    def _make_watchlist_request(self, action, media_type, items):
         key = "shows" if media_type == "series" else "movies"
-        payload = {key: [item]}
-        endpoint = "/sync/watchlist/remove" if action == "remove" else "/sync/watchlist"
+        payload = {key: items}
+        url = self._remove_url if action == "remove" else self._add_url
         
-        logger.info(f"{'Removing from' if action == 'remove' else 'Adding to'} watchlist: {payload}")
+        logger.info("%s watchlist: %s", "Removing from" if action == "remove" else "Adding to", payload)
         
         for attempt in range(2):
             body, status = http_post(
-                f"{self.trakt_base_url}{endpoint}",
+                url,
                 data=payload,
                 headers=trakt_headers()
             )
             
             if status == 401 and attempt == 0:
                 logger.info("Trakt token expired/unauthorized, refreshing and retrying...")
-                trakt_get_valid_tokens()
+                trakt_get_valid_tokens(force_refresh=True)
                 continue
                 
             if status >= 400:
-                raise Exception(f"Trakt watchlist operation failed: HTTP {status} {body}")
+                raise Exception(f"Trakt watchlist operation failed: {http_error_message(status, body)}")
                 
-            return json.loads(body) if body else {}
+            return json_loads(body) if body else {}
             
         raise Exception("Failed to perform watchlist operation after token refresh")
 
     def add_to_watchlist(self, media_type, item):
-        return self._make_watchlist_request("add", media_type, item)
+        return self._make_watchlist_request("add", media_type, [item])
 
     def remove_from_watchlist(self, media_type, item):
-        return self._make_watchlist_request("remove", media_type, item)
+        return self._make_watchlist_request("remove", media_type, [item])
+
+    def add_to_watchlist_batch(self, media_type, items):
+        return self._make_watchlist_request("add", media_type, list(items))
+
+    def remove_from_watchlist_batch(self, media_type, items):
+        return self._make_watchlist_request("remove", media_type, list(items))
 
     def test_connection(self):
         try:
             logger.info("Testing Trakt authentication by calling /users/me")
-            headers = trakt_headers()
-            req = urllib.request.Request(
+            body, status = http_request(
+                "GET",
                 f"{self.trakt_base_url}/users/me",
-                headers=headers,
-                method="GET"
+                headers=trakt_headers()
             )
-            with urllib.request.urlopen(req, timeout=10) as resp:
-                data = json.loads(resp.read().decode("utf-8"))
+            if status >= 400:
+                raise Exception(http_error_message(status, body))
+            data = json_loads(body)
             print("Trakt authentication successful. User:", data.get("username", "<unknown>"))
             logger.info("Trakt authentication test passed. User: %s", data.get("username", "<unknown>"))
             return True
         except Exception as e:
-            logger.error(f"Trakt authentication test failed: {e}\n{traceback.format_exc()}")
+            logger.error("Trakt authentication test failed: %s", e, exc_info=True)
             print(f"Trakt authentication test failed: {e}")
             return False
 
@@ -230,13 +345,21 @@ class EventHandler:
         if service_type == "radarr":
             self.media_type = "movie"
             self.env_prefix = "radarr_movie"
-            self.add_events = ["movieadded"]
-            self.remove_events = ["download", "moviedelete"]
+            self.add_events = frozenset({"movieadded"})
+            self.remove_events = frozenset({"download", "moviedelete"})
         else:  # sonarr
             self.media_type = "series"
             self.env_prefix = "sonarr_series"
-            self.add_events = ["seriesadd"]
-            self.remove_events = ["download", "seriesdelete"]
+            self.add_events = frozenset({"seriesadd"})
+            self.remove_events = frozenset({"download", "seriesdelete"})
+
+        self._title_key = f"{self.env_prefix}_title"
+        self._year_key = f"{self.env_prefix}_year"
+        self._imdbid_key = f"{self.env_prefix}_imdbid"
+        self._id_keys = (
+            ('tmdbId', f"{self.env_prefix}_tmdbid"),
+            ('tvdbId', f"{self.env_prefix}_tvdbid"),
+        )
 
     def handle_event(self, event_type, event_data):
         if event_type.lower() == "test":
@@ -247,43 +370,48 @@ class EventHandler:
             return False
         
         try:
-            item = format_item(event_data)
+            # A list of events (e.g. from a bulk import) is sent to Trakt in a single request
+            if isinstance(event_data, list):
+                items = [format_item(data) for data in event_data]
+            else:
+                items = [format_item(event_data)]
             event_type_lower = event_type.lower()
             
             if event_type_lower in self.add_events:
-                result = self.conn.add_to_watchlist(self.media_type, item)
-                self.logger.info(f"Added {self.media_type} to watchlist: {result}")
+                result = self.conn.add_to_watchlist_batch(self.media_type, items)
+                self.logger.info("Added %s to watchlist: %s", self.media_type, result)
                 return True
                 
             elif event_type_lower in self.remove_events:
-                result = self.conn.remove_from_watchlist(self.media_type, item)
-                self.logger.info(f"Removed {self.media_type} from watchlist: {result}")
+                result = self.conn.remove_from_watchlist_batch(self.media_type, items)
+                self.logger.info("Removed %s from watchlist: %s", self.media_type, result)
                 return True
                 
             else:
-                self.logger.info(f"No action for event type: {event_type}")
+                self.logger.info("No action for event type: %s", event_type)
                 return False
                 
         except Exception as e:
-            self.logger.error(f"Failed to handle event: {e}")
+            self.logger.error("Failed to handle event: %s", e)
             print(f"ERROR: Failed to handle event: {e}", flush=True)
             return False
 
     def build_event_data(self):
-        title_var = f"{self.env_prefix}_title"
-        if not os.getenv(title_var):
+        env = os.environ
+        title = env.get(self._title_key)
+        if not title:
             return None
             
         data = {
-            'title': os.getenv(title_var),
-            'year': int(os.getenv(f"{self.env_prefix}_year", 0)) or None,
-            'imdbId': os.getenv(f"{self.env_prefix}_imdbid"),
+            'title': title,
+            'year': int(env.get(self._year_key) or 0) or None,
+            'imdbId': env.get(self._imdbid_key),
         }
         
-        for id_type in ['tmdbid', 'tvdbid']:
-            env_key = f"{self.env_prefix}_{id_type}"
-            if os.getenv(env_key):
-                data[id_type] = int(os.getenv(env_key, 0)) or None
+        for data_key, env_key in self._id_keys:
+            raw = env.get(env_key)
+            if raw:
+                data[data_key] = int(raw) or None
         
         return data
 
@@ -302,7 +430,7 @@ def main():
         # Get event data from command line or environment
         if len(sys.argv) > 2:
             try:
-                event_data = json.loads(sys.argv[2])
+                event_data = json_loads(sys.argv[2])
             except json.JSONDecodeError as e:
                 print(f"ERROR: Invalid JSON data provided: {e}", flush=True)
                 sys.exit(1)
@@ -317,7 +445,7 @@ def main():
     except Exception as e:
         tb = traceback.format_exc()
         print(f"FATAL ERROR: {e}\n{tb}", flush=True)
-        logger.error(f"FATAL ERROR: {e}\n{tb}")
+        logger.error("FATAL ERROR: %s\n%s", e, tb)
         sys.exit(1)
 
 if __name__ == "__main__":